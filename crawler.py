@@ -1,32 +1,48 @@
 import json
+import orjson
 import time
 import re
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import random
 import hashlib
+import xxhash
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse, urljoin
 from urllib import robotparser
 from collections import deque
 import logging
 import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+_FA_TRANS = str.maketrans({'ي': 'ی', 'ك': 'ک'})
+_NONWORD_RE = re.compile(r'[^\w\s\u0600-\u06FF]')
+_WS_RE = re.compile(r'\s+')
+_IMG_EXT_RE = re.compile(r'\.(jpg|jpeg|png|gif|pdf|zip)$', re.I)
 
 class AdvancedCrawler:
-    def __init__(self, start_url, max_pages=4000, delay=1):
+    def __init__(self, start_url, max_pages=4000, delay=1, max_workers=8):
         self.start_url = self._normalize_url(start_url)
         self.max_pages = max_pages
         self.delay = delay
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self._next_request_at = 0.0
         self.domain = urlparse(self.start_url).netloc
         self.url_queue = deque([self.start_url])
         self.visited = set()
+        self.content_hashes = set()
         self.duplicate_count = 0
+        self.duplicate_content_count = 0
         self.error_count = 0
-        self.crawled_data = {}
+        self.output_file = None
         self.crawl_stats = {
             'total_crawled': 0,
             'final_queue_length': 0,
             'duplicate_urls': 0,
+            'duplicate_content': 0,
             'error_count': 0,
             'crawl_time': 0,
             'data_file_size_bytes': 0
@@ -38,6 +54,12 @@ class AdvancedCrawler:
     def _url_hash(self, url):
         return hashlib.md5(url.encode()).hexdigest()
 
+    def _visited_key(self, url):
+        return xxhash.xxh64_intdigest(url.encode())
+
+    def _content_hash(self, text):
+        return xxhash.xxh64_intdigest(text.encode())
+
     def _normalize_url(self, url):
         parsed = urlparse(url)
         path = parsed.path.rstrip('/') or '/'
@@ -53,6 +75,10 @@ class AdvancedCrawler:
 
     def _setup_session(self):
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=32,
+                              max_retries=Retry(total=2, backoff_factor=0.3))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.session.headers.update({
             'User-Agent': random.choice([
                 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
@@ -61,10 +87,10 @@ class AdvancedCrawler:
         })
 
     def _rotate_user_agent(self):
-        self.session.headers.update({'User-Agent': random.choice([
+        return random.choice([
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0'
-        ])})
+        ])
 
     def _fetch_robots_txt(self):
         robots_url = urljoin(self.start_url, '/robots.txt')
@@ -73,7 +99,7 @@ class AdvancedCrawler:
             if response.status_code == 200:
                 self.robot_parser = robotparser.RobotFileParser()
                 self.robot_parser.set_url(robots_url)
-                self.robot_parser.read()
+                self.robot_parser.parse(response.text.splitlines())
             else:
                 self.robot_parser = None
         except Exception as e:
@@ -87,16 +113,16 @@ class AdvancedCrawler:
         parsed_url = urlparse(url)
         return (parsed_url.netloc == self.domain and
                 parsed_url.scheme in ('http', 'https') and
-                not re.search(r'\.(jpg|jpeg|png|gif|pdf|zip)$', url))
+                not _IMG_EXT_RE.search(url))
 
     def _normalize_text(self, text):
-        text = text.replace('ي', 'ی').replace('ك', 'ک')
-        text = re.sub(r'[^\w\s\u0600-\u06FF]', '', text)
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = text.translate(_FA_TRANS)
+        text = _NONWORD_RE.sub('', text)
+        text = _WS_RE.sub(' ', text).strip()
         return text
 
     def _extract_content(self, html):
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = BeautifulSoup(html, 'lxml')
         title = soup.title.text.strip() if soup.title else ""
         title = self._normalize_text(title)
 
@@ -104,32 +130,89 @@ class AdvancedCrawler:
         body_text = body.get_text(separator=" ", strip=True) if body else ""
         body_text = self._normalize_text(body_text)
 
-        return title, body_text
+        return title, body_text, soup
 
     def _handle_links(self, soup, base_url):
-        new_links = 0
-        for link in soup.find_all('a', href=True):
-            absolute_url = urljoin(base_url, link['href'])
-            normalized_url = self._normalize_url(absolute_url)
+        normalized_urls = [
+            self._normalize_url(urljoin(base_url, link['href']))
+            for link in soup.find_all('a', href=True)
+        ]
 
-            if normalized_url in self.visited:
-                self.duplicate_count += 1
-                continue
+        new_links = 0
+        with self.lock:
+            for normalized_url in normalized_urls:
+                if self._visited_key(normalized_url) in self.visited:
+                    self.duplicate_count += 1
+                    continue
 
-            if self._is_valid(normalized_url):
-                self.url_queue.append(normalized_url)
-                new_links += 1
+                if self._is_valid(normalized_url):
+                    self.url_queue.append(normalized_url)
+                    new_links += 1
         return new_links
 
-    def _save_output(self):
-        with open('crawled_pages.json', 'w', encoding='utf-8') as f:
-            json.dump(self.crawled_data, f, ensure_ascii=False, indent=4)
+    def _wait_for_slot(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self._next_request_at)
+            self._next_request_at = slot + random.uniform(self.delay, self.delay * 1.5)
+        time.sleep(slot - now)
+
+    def _next_url(self):
+        with self.lock:
+            while self.url_queue:
+                url = self.url_queue.popleft()
+                key = self._visited_key(url)
+                if key in self.visited:
+                    continue
+                self.visited.add(key)
+
+                if self._is_allowed(url):
+                    return url
+        return None
+
+    def _crawl_page(self, current_url):
+        try:
+            user_agent = self._rotate_user_agent()
+            self._wait_for_slot()
+
+            response = self.session.get(current_url, headers={'User-Agent': user_agent}, timeout=15)
+            if response.status_code == 200 and 'text/html' in response.headers.get('Content-Type', ''):
+                title, body_text, soup = self._extract_content(response.text)
+
+                url_hash = self._url_hash(current_url)
+                content_hash = self._content_hash(body_text)
+                with self.lock:
+                    if self.crawl_stats['total_crawled'] >= self.max_pages:
+                        return
+                    if body_text and content_hash in self.content_hashes:
+                        self.duplicate_content_count += 1
+                        self.logger.info(f"Duplicate content: {current_url}")
+                        return
+                    self.content_hashes.add(content_hash)
+                    self.output_file.write(orjson.dumps({url_hash: {
+                        'url': current_url,
+                        'title': title,
+                        'body': body_text
+                    }}) + b'\n')
+                    self.crawl_stats['total_crawled'] += 1
+                    if self.crawl_stats['total_crawled'] % 50 == 0:
+                        self.output_file.flush()
+
+                new_links = self._handle_links(soup, current_url)
+                self.logger.info(f"Crawled: {current_url} | New links: {new_links}")
+
+        except Exception as e:
+            with self.lock:
+                self.error_count += 1
+            self.logger.error(f"Error crawling {current_url}: {str(e)}")
 
+    def _save_output(self):
         self.crawl_stats['duplicate_urls'] = self.duplicate_count
+        self.crawl_stats['duplicate_content'] = self.duplicate_content_count
         self.crawl_stats['error_count'] = self.error_count
 
         try:
-            file_size = os.path.getsize('crawled_pages.json')
+            file_size = os.path.getsize('crawled_pages.jsonl')
         except OSError:
             file_size = 0
         self.crawl_stats['data_file_size_bytes'] = file_size
@@ -138,8 +221,8 @@ class AdvancedCrawler:
             'statistics': self.crawl_stats
         }
 
-        with open('crawl_report.json', 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=4)
+        with open('crawl_report.json', 'wb') as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
 
     def _status_monitor(self):
         while True:
@@ -153,44 +236,24 @@ class AdvancedCrawler:
         monitor_thread.start()
 
         start_time = time.time()
+        self.output_file = open('crawled_pages.jsonl', 'wb')
 
         try:
-            while self.crawl_stats['total_crawled'] < self.max_pages and self.url_queue:
-                current_url = self.url_queue.popleft()
-
-                if current_url in self.visited:
-                    continue
-                self.visited.add(current_url)
-
-                if not self._is_allowed(current_url):
-                    continue
-
-                try:
-                    self._rotate_user_agent()
-                    time.sleep(random.uniform(self.delay, self.delay * 1.5))
-
-                    response = self.session.get(current_url, timeout=15)
-                    if response.status_code == 200 and 'text/html' in response.headers.get('Content-Type', ''):
-                        title, body_text = self._extract_content(response.text)
-
-                        url_hash = self._url_hash(current_url)
-                        self.crawled_data[url_hash] = {
-                            'url': current_url,
-                            'title': title,
-                            'body': body_text
-                        }
-
-                        soup = BeautifulSoup(response.text, 'html.parser')
-                        new_links = self._handle_links(soup, current_url)
-
-                        self.crawl_stats['total_crawled'] += 1
-                        self.logger.info(f"Crawled: {current_url} | New links: {new_links}")
-
-                except Exception as e:
-                    self.error_count += 1
-                    self.logger.error(f"Error crawling {current_url}: {str(e)}")
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending = set()
+                while True:
+                    while len(pending) < self.max_workers and self.crawl_stats['total_crawled'] < self.max_pages:
+                        current_url = self._next_url()
+                        if current_url is None:
+                            break
+                        pending.add(executor.submit(self._crawl_page, current_url))
+
+                    if not pending:
+                        break
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
 
         finally:
+            self.output_file.close()
             end_time = time.time()
             self.crawl_stats['crawl_time'] = round(end_time - start_time, 2)
             self.crawl_stats['final_queue_length'] = len(self.url_queue)
@@ -203,6 +266,7 @@ if __name__ == "__main__":
     crawler = AdvancedCrawler(
         start_url="https://www.zoomit.ir/",
         max_pages=4000,
-        delay=1
+        delay=1,
+        max_workers=8
     )
     crawler.crawl()
\ No newline at end of file
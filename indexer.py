@@ -1,108 +1,222 @@
 import json
+import orjson
+import os
 import re
 import time
-import pickle
+import numpy as np
+import xxhash
 from collections import defaultdict
-from math import log
+from itertools import chain
+
+_FA_TRANS = str.maketrans({'ي': 'ی', 'ك': 'ک'})
+_NONWORD_RE = re.compile(r'[^\w\s\u0600-\u06FF]')
+_TOKEN_RE = re.compile(r'[\w\u0600-\u06FF]+')
+
+
+def _quantize(scores):
+    limit = np.finfo(np.float16).max
+    return np.clip(scores, -limit, limit).astype(np.float16)
+
+
+def _offsets(lengths):
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+class _Posting:
+    __slots__ = ('title_tf', 'body_tf', 'title_pos', 'body_pos')
+
+    def __init__(self):
+        self.title_tf = 0
+        self.body_tf = 0
+        self.title_pos = []
+        self.body_pos = []
 
 
 class Indexer:
     def __init__(self):
-        self.inverted_index = defaultdict(lambda: defaultdict(lambda: {
-            'title_tf': 0, 'body_tf': 0, 'title_positions': [], 'body_positions': []
-        }))
+        self.postings = {}
+        self.doc_ids = []
+        self.doc_id_to_int = {}
         self.document_lengths = {}
         self.doc_count = 0
+        self.content_hashes = set()
+        self.duplicate_count = 0
         self.idf_values = {}
 
     def _tokenize(self, text):
-        text = text.replace('ي', 'ی').replace('ك', 'ک')
-        text = re.sub(r'[^\w\s\u0600-\u06FF]', '', text.lower())
-        return re.findall(r'[\w\u0600-\u06FF]+', text)
-
-    def build_index(self, data):
-        self.doc_count = len(data)
-
-        for doc_id, content in data.items():
-            title_tokens = self._tokenize(content.get('title', ''))
-            body_tokens = self._tokenize(content.get('body', ''))
-
-            self.document_lengths[doc_id] = {
-                'title': len(title_tokens),
-                'body': len(body_tokens)
-            }
-
-            for i, token in enumerate(title_tokens):
-                doc_entry = self.inverted_index[token][doc_id]
-                doc_entry['title_tf'] += 1
-                doc_entry['title_positions'].append(i)
-
-            for i, token in enumerate(body_tokens):
-                doc_entry = self.inverted_index[token][doc_id]
-                doc_entry['body_tf'] += 1
-                doc_entry['body_positions'].append(i)
-
-        for token, postings in self.inverted_index.items():
-            doc_frequency = len(postings)
-            idf = log(self.doc_count / (doc_frequency + 1))
-            self.idf_values[token] = idf
-            for doc_id in postings:
-                postings[doc_id]['title_tf_idf'] = postings[doc_id]['title_tf'] * idf
-                postings[doc_id]['body_tf_idf'] = postings[doc_id]['body_tf'] * idf
+        text = text.translate(_FA_TRANS)
+        text = _NONWORD_RE.sub('', text.lower())
+        for match in _TOKEN_RE.finditer(text):
+            yield match.group(0)
+
+    def _token_positions(self, text):
+        positions = defaultdict(list)
+        for i, token in enumerate(self._tokenize(text)):
+            positions[token].append(i)
+        return positions
+
+    def _is_duplicate(self, body):
+        if not body:
+            return False
+        content_hash = xxhash.xxh64_intdigest(body.encode())
+        if content_hash in self.content_hashes:
+            return True
+        self.content_hashes.add(content_hash)
+        return False
+
+    def build_index(self, documents):
+        title_lengths, body_lengths = [], []
+
+        for doc_id, content in documents:
+            if doc_id in self.doc_id_to_int or self._is_duplicate(content.get('body', '')):
+                self.duplicate_count += 1
+                continue
+
+            doc = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self.doc_id_to_int[doc_id] = doc
+            title_positions = self._token_positions(content.get('title', ''))
+            body_positions = self._token_positions(content.get('body', ''))
+
+            title_lengths.append(sum(map(len, title_positions.values())))
+            body_lengths.append(sum(map(len, body_positions.values())))
+
+            for token, positions in title_positions.items():
+                key = (token, doc)
+                posting = self.postings.get(key)
+                if posting is None:
+                    posting = self.postings[key] = _Posting()
+                posting.title_tf += len(positions)
+                posting.title_pos.extend(positions)
+
+            for token, positions in body_positions.items():
+                key = (token, doc)
+                posting = self.postings.get(key)
+                if posting is None:
+                    posting = self.postings[key] = _Posting()
+                posting.body_tf += len(positions)
+                posting.body_pos.extend(positions)
+
+        self.doc_count = len(self.doc_ids)
+        self.document_lengths = {
+            'title': np.array(title_lengths, dtype=np.int32),
+            'body': np.array(body_lengths, dtype=np.int32)
+        }
+
+        total = len(self.postings)
+        term_ids = {}
+        posting_terms = np.fromiter(
+            (term_ids.setdefault(token, len(term_ids)) for token, _ in self.postings),
+            dtype=np.int32, count=total
+        )
+        posting_docs = np.fromiter((doc for _, doc in self.postings), dtype=np.int32, count=total)
+        order = np.lexsort((posting_docs, posting_terms))
+
+        tokens = list(term_ids)
+        doc_frequency = np.bincount(posting_terms, minlength=len(tokens)).astype(np.int32)
+        idf = np.log(self.doc_count / (doc_frequency + 1)).astype(np.float32)
+        self.idf_values = dict(zip(tokens, idf.tolist()))
+
+        offsets = _offsets(doc_frequency)
+        postings = list(self.postings.values())
+        entries = [postings[i] for i in order.tolist()]
+        doc_ids = posting_docs[order]
+        title_tf = np.fromiter((e.title_tf for e in entries), dtype=np.int32, count=total)
+        body_tf = np.fromiter((e.body_tf for e in entries), dtype=np.int32, count=total)
+
+        posting_idf = np.repeat(idf, doc_frequency)
+        title_tf_idf = _quantize(title_tf.astype(np.float32) * posting_idf)
+        body_tf_idf = _quantize(body_tf.astype(np.float32) * posting_idf)
+
+        title_pos_offsets = _offsets(title_tf)
+        body_pos_offsets = _offsets(body_tf)
 
         final_index = {
-            token: {
-                doc_id: {
-                    'title_tf_idf': data['title_tf_idf'],
-                    'body_tf_idf': data['body_tf_idf'],
-                    'title_positions': data['title_positions'],
-                    'body_positions': data['body_positions']
-                } for doc_id, data in postings.items()
-            } for token, postings in self.inverted_index.items()
+            'tokens': tokens,
+            'offsets': offsets,
+            'doc_ids': doc_ids,
+            'title_tf_idf': title_tf_idf,
+            'body_tf_idf': body_tf_idf,
+            'title_pos_offsets': title_pos_offsets,
+            'title_pos': np.fromiter(chain.from_iterable(e.title_pos for e in entries),
+                                     dtype=np.int32, count=int(title_pos_offsets[-1])),
+            'body_pos_offsets': body_pos_offsets,
+            'body_pos': np.fromiter(chain.from_iterable(e.body_pos for e in entries),
+                                    dtype=np.int32, count=int(body_pos_offsets[-1]))
         }
 
         return final_index, self.document_lengths, self.idf_values
 
-    def save_index(self, index, doc_lengths, idf_values, output_file='index_data.pkl'):
-        index_data = {
-            'inverted_index': index,
-            'document_lengths': doc_lengths,
-            'idf_values': idf_values
-        }
-        with open(output_file, 'wb') as f:
-            pickle.dump(index_data, f)
+    def save_index(self, index, doc_ids, doc_lengths, idf_values, output_dir='index_data'):
+        tokens = index['tokens']
+
+        arrays = dict(
+            vocab=np.frombuffer('\n'.join(tokens).encode('utf-8'), dtype=np.uint8),
+            doc_ids=np.array(doc_ids, dtype=str),
+            df=np.diff(index['offsets']).astype(np.int32),
+            idf=np.array([idf_values[token] for token in tokens], dtype=np.float32),
+            offsets=index['offsets'],
+            docids=index['doc_ids'],
+            title_tf_idf=index['title_tf_idf'],
+            body_tf_idf=index['body_tf_idf'],
+            title_pos_offsets=index['title_pos_offsets'],
+            title_pos=index['title_pos'],
+            body_pos_offsets=index['body_pos_offsets'],
+            body_pos=index['body_pos'],
+            title_lengths=doc_lengths['title'],
+            body_lengths=doc_lengths['body'],
+            inv_sqrt_title=(1 / np.sqrt(np.maximum(doc_lengths['title'], 1))).astype(np.float32),
+            inv_sqrt_body=(1 / np.sqrt(np.maximum(doc_lengths['body'], 1))).astype(np.float32)
+        )
+
+        os.makedirs(output_dir, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(output_dir, f'{name}.npy'), array)
+
+
+def iter_crawled_pages(filepath):
+    with open(filepath, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield from orjson.loads(line).items()
 
 
 def build_inverted_index():
     start_time = time.time()
 
+    page_metadata = {}
+
+    def documents():
+        for doc_id, content in iter_crawled_pages('crawled_pages.jsonl'):
+            page_metadata.setdefault(doc_id, {'url': content['url'], 'title': content['title']})
+            yield doc_id, content
+
+    indexer = Indexer()
     try:
-        with open('crawled_pages.json', 'r', encoding='utf-8') as f:
-            crawled_data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Error loading crawled_pages.json: {e}")
+        index, doc_lengths, idf_values = indexer.build_index(documents())
+    except (FileNotFoundError, orjson.JSONDecodeError) as e:
+        print(f"Error loading crawled_pages.jsonl: {e}")
         return
 
-    indexer = Indexer()
-    index, doc_lengths, idf_values = indexer.build_index(crawled_data)
-    indexer.save_index(index, doc_lengths, idf_values)
+    indexer.save_index(index, indexer.doc_ids, doc_lengths, idf_values)
 
-    metadata = {
-        doc_id: {'url': content['url'], 'title': content['title']}
-        for doc_id, content in crawled_data.items()
-    }
-    with open('metadata.json', 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=4)
+    metadata = {doc_id: page_metadata[doc_id] for doc_id in indexer.doc_ids}
+
+    with open('metadata.json', 'wb') as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
 
     end_time = time.time()
 
     stats = {
-        'total_documents': len(crawled_data),
-        'unique_terms': len(index),
+        'total_documents': indexer.doc_count,
+        'duplicate_documents': indexer.duplicate_count,
+        'unique_terms': len(index['tokens']),
         'total_time_seconds': round(end_time - start_time, 2)
     }
-    with open('indexing_report.json', 'w', encoding='utf-8') as f:
-        json.dump(stats, f, ensure_ascii=False, indent=4)
+    with open('indexing_report.json', 'wb') as f:
+        f.write(orjson.dumps(stats, option=orjson.OPT_INDENT_2))
 
     print("Indexing process completed successfully.")
     print(json.dumps(stats, indent=4))
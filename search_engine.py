@@ -1,64 +1,118 @@
-import json
+import orjson
+import os
 import re
 import time
-import pickle
-import math
+import functools
+import heapq
+import numpy as np
+from numba import njit
 from flask import Flask, request, render_template, send_from_directory
 
 app = Flask(__name__)
 
+MAX_RESULTS = 20
+SNIPPET_LENGTH = 300
+TITLE_MATCH_BONUS = 50
 
-def load_json_file(filepath):
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        print(f"Error loading {filepath}: {e}")
-        return {}
+_FA_TRANS = str.maketrans({'ي': 'ی', 'ك': 'ک'})
+_NONWORD_RE = re.compile(r'[^\w\s\u0600-\u06FF]')
+_TOKEN_RE = re.compile(r'[\w\u0600-\u06FF]+')
 
 
-def load_pickle_file(filepath):
+def load_jsonl_file(filepath):
+    records = {}
     try:
         with open(filepath, 'rb') as f:
-            return pickle.load(f)
-    except (FileNotFoundError, pickle.UnpicklingError) as e:
+            for line in f:
+                if line.strip():
+                    records.update(orjson.loads(line))
+    except (FileNotFoundError, orjson.JSONDecodeError) as e:
         print(f"Error loading {filepath}: {e}")
+    return records
+
+
+def load_index_dir(dirpath):
+    try:
+        return {
+            os.path.splitext(name)[0]: np.load(os.path.join(dirpath, name), mmap_mode='r')
+            for name in os.listdir(dirpath) if name.endswith('.npy')
+        }
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error loading {dirpath}: {e}")
         return {}
 
 
-crawled_pages = load_json_file('crawled_pages.json')
-index_data = load_pickle_file('index_data.pkl')
+crawled_pages = load_jsonl_file('crawled_pages.jsonl')
+index_data = load_index_dir('index_data')
 
-inverted_index = index_data.get('inverted_index', {})
-document_lengths = index_data.get('document_lengths', {})
-idf_values = index_data.get('idf_values', {})
+vocab = bytes(index_data.get('vocab', b'')).decode('utf-8')
+term_ids = {term: i for i, term in enumerate(vocab.split('\n'))} if vocab else {}
+doc_ids = index_data.get('doc_ids')
+idf_values = index_data.get('idf')
+offsets = index_data.get('offsets')
+posting_doc_ids = index_data.get('docids')
+title_tf_idf = index_data.get('title_tf_idf')
+body_tf_idf = index_data.get('body_tf_idf')
+field_positions = {
+    'title': (index_data.get('title_pos_offsets'), index_data.get('title_pos')),
+    'body': (index_data.get('body_pos_offsets'), index_data.get('body_pos'))
+}
+inv_sqrt_title = index_data.get('inv_sqrt_title')
+inv_sqrt_body = index_data.get('inv_sqrt_body')
 
 
-def find_minimal_span(position_lists):
-    if not position_lists or any(not lst for lst in position_lists):
-        return float('inf')
+def posting_range(term):
+    term_id = term_ids.get(term)
+    if term_id is None:
+        return None
+    return int(offsets[term_id]), int(offsets[term_id + 1])
+
 
-    all_positions = sorted([
-        (pos, term_idx)
-        for term_idx, term_positions in enumerate(position_lists)
-        for pos in term_positions
-    ])
+def lookup_postings(term):
+    term_range = posting_range(term)
+    if term_range is None:
+        return {}
+    start, end = term_range
+    return dict(zip(posting_doc_ids[start:end].tolist(), range(start, end)))
+
+
+def posting_positions(field, posting):
+    pos_offsets, positions = field_positions[field]
+    return positions[pos_offsets[posting]:pos_offsets[posting + 1]]
+
+
+def has_positions(field, postings):
+    pos_offsets = field_positions[field][0]
+    return np.all(pos_offsets[postings + 1] > pos_offsets[postings], axis=0)
 
-    num_terms = len(position_lists)
-    term_counts = [0] * num_terms
+
+def top_results(candidates, scores, k=MAX_RESULTS):
+    k = min(k, len(scores))
+    if k == 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return [(str(doc_ids[candidates[i]]), float(scores[i])) for i in top]
+
+
+@njit(cache=True)
+def _min_span_nb(positions, term_idx, num_terms):
+    term_counts = np.zeros(num_terms, dtype=np.int32)
     terms_in_window = 0
     left_pointer = 0
-    min_span = float('inf')
+    min_span = 2 ** 31 - 1
 
-    for i, (pos, term_idx) in enumerate(all_positions):
-        if term_counts[term_idx] == 0:
+    for i in range(positions.shape[0]):
+        if term_counts[term_idx[i]] == 0:
             terms_in_window += 1
-        term_counts[term_idx] += 1
+        term_counts[term_idx[i]] += 1
 
         while terms_in_window == num_terms:
-            left_pos, left_term_idx = all_positions[left_pointer]
-            min_span = min(min_span, pos - left_pos)
+            span = positions[i] - positions[left_pointer]
+            if span < min_span:
+                min_span = span
 
+            left_term_idx = term_idx[left_pointer]
             term_counts[left_term_idx] -= 1
             if term_counts[left_term_idx] == 0:
                 terms_in_window -= 1
@@ -67,7 +121,22 @@ def find_minimal_span(position_lists):
     return min_span
 
 
+_min_span_nb(np.zeros(1, dtype=np.int32), np.zeros(1, dtype=np.int32), 1)
+
+
+def find_minimal_span(position_lists):
+    if not position_lists or any(len(lst) == 0 for lst in position_lists):
+        return float('inf')
+
+    positions = np.concatenate(position_lists).astype(np.int32, copy=False)
+    term_idx = np.repeat(np.arange(len(position_lists), dtype=np.int32), [len(lst) for lst in position_lists])
+    order = np.argsort(positions, kind='stable')
+    return int(_min_span_nb(positions[order], term_idx[order], len(position_lists)))
+
+
 class SearchEngine:
+    __slots__ = ('title_weight', 'body_weight', 'span_boost_factor', 'proximity_power', 'max_span_dist')
+
     def __init__(self, title_weight=0.7, body_weight=0.3, span_boost_factor=2.0, proximity_power=3.0, max_span_dist=20):
         self.title_weight = title_weight
         self.body_weight = body_weight
@@ -75,16 +144,17 @@ class SearchEngine:
         self.proximity_power = proximity_power
         self.max_span_dist = max_span_dist
 
+    @functools.lru_cache(maxsize=4096)
     def _tokenize_query(self, query):
-        normalized_query = query.replace('ي', 'ی').replace('ك', 'ک')
-        clean_query = re.sub(r'[^\w\s\u0600-\u06FF]', ' ', normalized_query.lower())
-        return re.findall(r'[\w\u0600-\u06FF]+', clean_query)
+        normalized_query = query.translate(_FA_TRANS)
+        clean_query = _NONWORD_RE.sub(' ', normalized_query.lower())
+        return tuple(_TOKEN_RE.findall(clean_query))
 
-    def _find_phrase_in_field(self, terms, doc_id, field_positions_key):
-        first_term_positions = inverted_index[terms[0]][doc_id].get(field_positions_key, [])
-        for pos in first_term_positions:
+    def _find_phrase_in_field(self, terms, postings, doc, field):
+        term_positions = [set(posting_positions(field, postings[term][doc]).tolist()) for term in terms]
+        for pos in term_positions[0]:
             is_match = all(
-                (pos + i) in inverted_index[terms[i]][doc_id].get(field_positions_key, [])
+                (pos + i) in term_positions[i]
                 for i in range(1, len(terms))
             )
             if is_match:
@@ -92,102 +162,130 @@ class SearchEngine:
         return False
 
     def _rank_phrase(self, terms):
-        if not terms: return []
+        if not terms: return [], 0
         if len(terms) == 1: return self._rank(terms)
 
         scores = {}
-        first_term = terms[0]
-        if first_term not in inverted_index: return []
+        postings = {term: lookup_postings(term) for term in terms}
+        if not postings[terms[0]]: return [], 0
 
-        candidate_docs = inverted_index[first_term].keys()
-        for doc_id in candidate_docs:
-            if not all(term in inverted_index and doc_id in inverted_index[term] for term in terms):
+        candidate_docs = postings[terms[0]].keys()
+        for doc in candidate_docs:
+            if not all(doc in postings[term] for term in terms):
                 continue
 
-            has_title_match = self._find_phrase_in_field(terms, doc_id, 'title_positions')
-            has_body_match = self._find_phrase_in_field(terms, doc_id, 'body_positions')
+            has_title_match = self._find_phrase_in_field(terms, postings, doc, 'title')
+            has_body_match = self._find_phrase_in_field(terms, postings, doc, 'body')
 
             if has_title_match or has_body_match:
                 base_score = sum(
-                    inverted_index[term][doc_id].get('title_tf_idf', 0) * self.title_weight +
-                    inverted_index[term][doc_id].get('body_tf_idf', 0) * self.body_weight
+                    float(title_tf_idf[postings[term][doc]]) * self.title_weight +
+                    float(body_tf_idf[postings[term][doc]]) * self.body_weight
                     for term in terms
                 )
-                scores[doc_id] = base_score * 100
+                scores[doc] = base_score * 100
+
+        candidates = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+        phrase_scores = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+        return top_results(candidates, phrase_scores), len(scores)
+
+    def _proximity_bonus(self, postings):
+        num_terms = len(postings)
+        prox_bonus, title_match_bonus = 0.0, 0.0
+
+        title_pos = [posting_positions('title', posting) for posting in postings]
+        if all(len(positions) for positions in title_pos):
+            span = find_minimal_span(title_pos)
+            if span < self.max_span_dist:
+                prox_bonus += (1.0 / (1.0 + span)) ** self.proximity_power * self.title_weight
+            if span == num_terms - 1:
+                title_match_bonus = TITLE_MATCH_BONUS
+
+        body_pos = [posting_positions('body', posting) for posting in postings]
+        if all(len(positions) for positions in body_pos):
+            span = find_minimal_span(body_pos)
+            if span < self.max_span_dist:
+                prox_bonus += (1.0 / (1.0 + span)) ** self.proximity_power * self.body_weight
+
+        return prox_bonus, title_match_bonus
+
+    def _add_proximity(self, combined_scores, term_postings):
+        final_scores = combined_scores.copy()
+        full_matches = np.all(term_postings >= 0, axis=0)
+        full_idx = np.flatnonzero(full_matches)
+        if not len(full_idx):
+            return final_scores
+
+        full_postings = term_postings[:, full_idx]
+        in_title = has_positions('title', full_postings)
+        in_body = has_positions('body', full_postings)
+        max_prox = np.where(in_title, self.title_weight, 0.0) + np.where(in_body, self.body_weight, 0.0)
+        full_scores = combined_scores[full_idx]
+        growth = full_scores * self.span_boost_factor * max_prox
+        upper_bounds = full_scores + np.maximum(growth, 0) + np.where(in_title, TITLE_MATCH_BONUS, 0)
+        lower_bounds = full_scores + np.minimum(growth, 0)
+
+        top_scores = heapq.nlargest(MAX_RESULTS, final_scores[~full_matches].tolist())
+        heapq.heapify(top_scores)
+
+        for j in np.argsort(-upper_bounds, kind='stable'):
+            threshold = top_scores[0] if len(top_scores) == MAX_RESULTS else -np.inf
+            if upper_bounds[j] < threshold and lower_bounds[j] > 0:
+                continue
+
+            i = full_idx[j]
+            prox_bonus, title_match_bonus = self._proximity_bonus(term_postings[:, i])
+            final_scores[i] = combined_scores[i] * (1 + self.span_boost_factor * prox_bonus) + title_match_bonus
+            if len(top_scores) < MAX_RESULTS:
+                heapq.heappush(top_scores, final_scores[i])
+            else:
+                heapq.heappushpop(top_scores, final_scores[i])
 
-        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return final_scores
 
     def _rank(self, terms):
-        if not terms: return []
+        if not terms: return [], 0
 
-        candidate_docs = set()
-        for term in terms:
-            if term in inverted_index:
-                candidate_docs.update(inverted_index[term].keys())
+        term_ranges = [posting_range(term) for term in terms]
+        found_ranges = [term_range for term_range in term_ranges if term_range]
+        if not found_ranges: return [], 0
 
-        if not candidate_docs: return []
+        candidates = np.unique(np.concatenate([posting_doc_ids[start:end] for start, end in found_ranges]))
+        title_scores = np.zeros(len(candidates))
+        body_scores = np.zeros(len(candidates))
+        term_postings = np.full((len(terms), len(candidates)), -1, dtype=np.int64)
 
-        scores = {}
-        for doc_id in candidate_docs:
-            data = {'title_score': 0.0, 'body_score': 0.0, 'title_pos': [], 'body_pos': []}
-            all_in_title, all_in_body = True, True
-
-            for term in terms:
-                term_data = inverted_index.get(term, {}).get(doc_id)
-                if not term_data:
-                    all_in_title, all_in_body = False, False
-                    continue
-
-                data['title_score'] += term_data.get('title_tf_idf', 0)
-                data['body_score'] += term_data.get('body_tf_idf', 0)
-
-                title_positions, body_positions = term_data.get('title_positions', []), term_data.get('body_positions',
-                                                                                                      [])
-                if title_positions:
-                    data['title_pos'].append(title_positions)
-                else:
-                    all_in_title = False
-                if body_positions:
-                    data['body_pos'].append(body_positions)
-                else:
-                    all_in_body = False
-
-            title_len = document_lengths.get(doc_id, {}).get('title', 1) or 1
-            body_len = document_lengths.get(doc_id, {}).get('body', 1) or 1
-
-            norm_title = data['title_score'] / math.sqrt(title_len)
-            norm_body = data['body_score'] / math.sqrt(body_len)
-
-            combined_score = (norm_title * self.title_weight) + (norm_body * self.body_weight)
-
-            prox_bonus, title_match_bonus = 0.0, 0.0
-            if all_in_title and len(data['title_pos']) == len(terms):
-                span = find_minimal_span(data['title_pos'])
-                if span < self.max_span_dist:
-                    prox_bonus += (1.0 / (1.0 + span)) ** self.proximity_power * self.title_weight
-                if span == len(terms) - 1:
-                    title_match_bonus = 50
-
-            if all_in_body and len(data['body_pos']) == len(terms):
-                span = find_minimal_span(data['body_pos'])
-                if span < self.max_span_dist:
-                    prox_bonus += (1.0 / (1.0 + span)) ** self.proximity_power * self.body_weight
-
-            final_score = combined_score * (1 + self.span_boost_factor * prox_bonus) + title_match_bonus
-            if final_score > 0:
-                scores[doc_id] = final_score
-
-        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        for term_idx, term_range in enumerate(term_ranges):
+            if term_range is None:
+                continue
+            start, end = term_range
+            idx = np.searchsorted(candidates, posting_doc_ids[start:end])
+            title_scores[idx] += title_tf_idf[start:end]
+            body_scores[idx] += body_tf_idf[start:end]
+            term_postings[term_idx, idx] = np.arange(start, end)
+
+        norm_title = title_scores * inv_sqrt_title[candidates]
+        norm_body = body_scores * inv_sqrt_body[candidates]
+        combined_scores = (norm_title * self.title_weight) + (norm_body * self.body_weight)
+
+        final_scores = self._add_proximity(combined_scores, term_postings)
+        positive = final_scores > 0
+        return top_results(candidates[positive], final_scores[positive]), int(np.count_nonzero(positive))
 
     def search(self, query):
         clean_query = query.strip()
         if clean_query.startswith('"') and clean_query.endswith('"'):
             phrase = clean_query.strip('"')
             terms = self._tokenize_query(phrase)
-            return self._rank_phrase(terms), terms
+            docs, total = self._rank_phrase(terms)
+            return docs, total, terms
         else:
             terms = self._tokenize_query(clean_query)
-            return self._rank(terms), terms
+            docs, total = self._rank(terms)
+            return docs, total, terms
+
+
+ENGINE = SearchEngine()
 
 
 @app.route('/')
@@ -195,15 +293,26 @@ def home():
     return render_template('search.html')
 
 
+@functools.lru_cache(maxsize=1024)
+def highlight_pattern(terms):
+    if not terms:
+        return None
+    alternatives = sorted(set(terms), key=len, reverse=True)
+    return re.compile('(' + '|'.join(map(re.escape, alternatives)) + ')', re.IGNORECASE)
+
+
 def format_results(docs, terms):
     results = []
-    for doc_id, score in docs[:20]:
+    pattern = highlight_pattern(tuple(terms))
+    for doc_id, score in docs[:MAX_RESULTS]:
         doc = crawled_pages.get(doc_id, {})
         snippet_text = doc.get('body', '')
-        snippet = (snippet_text[:300] + '...') if len(snippet_text) > 300 else snippet_text
+        snippet = snippet_text[:SNIPPET_LENGTH]
+        if len(snippet_text) > SNIPPET_LENGTH:
+            snippet += '...'
 
-        for term in terms:
-            snippet = re.sub(f'({re.escape(term)})', r'<strong>\1</strong>', snippet, flags=re.IGNORECASE)
+        if pattern:
+            snippet = pattern.sub(r'<strong>\1</strong>', snippet)
 
         results.append({
             'title': doc.get('title', 'بدون عنوان'),
@@ -221,12 +330,11 @@ def search():
         return render_template('search.html')
 
     start_time = time.time()
-    engine = SearchEngine()
-    docs, terms = engine.search(query)
+    docs, total, terms = ENGINE.search(query)
     results = format_results(docs, terms)
     elapsed_time = round(time.time() - start_time, 3)
 
-    return render_template('results.html', query=query, results=results, total=len(docs), time=elapsed_time)
+    return render_template('results.html', query=query, results=results, total=total, time=elapsed_time)
 
 
 @app.route('/static/<path:filename>')